@@ -9,17 +9,190 @@ SUPABASE CLIENT - SUPERBID (SCHEMA REAL) + HEARTBEAT
 """
 
 import os
+import re
+import sys
+import ssl
+import json
 import time
 import requests
 import traceback
+import http.client
+from itertools import islice
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime
-from typing import List, Dict, Optional, Any
+from urllib.parse import urlsplit
+from typing import List, Dict, Optional, Any, Tuple, Iterable
+
+try:
+    import orjson  # serializer em C (opcional)
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj) -> bytes:
+    """Serializa o payload em JSON (orjson quando disponível)"""
+    if orjson:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass  # ex.: int > 64 bits ou chave não-str - stdlib resolve
+    return json.dumps(obj).encode('utf-8')
+
+
+# ============================================
+# GRUPOS DE CAMPOS DO SCHEMA (por tipo)
+# ============================================
+_INT_FIELDS = (
+    'offer_id', 'product_id', 'lot_number', 'auction_id', 'group_offer_id',
+    'product_type_id', 'sub_category_id', 'auction_status_id', 'judicial_praca',
+    'store_id', 'manager_id', 'total_bidders', 'total_bids', 'total_received_proposals',
+    'current_winner_id', 'year_manufacture', 'year_model', 'km', 'photo_count',
+    'video_url_count', 'offer_status_id', 'offer_type_id', 'status_code',
+    'quantity_in_lot', 'quantity_sold', 'quantity_reserved', 'visits', 'seller_id',
+    'max_installments', 'end_date_time',
+)
+
+_FLOAT_FIELDS = (
+    'location_lat', 'location_lon', 'price', 'initial_bid_value', 'current_min_bid',
+    'current_max_bid', 'reserved_price', 'bid_increment', 'commission_percent',
+    'transaction_limit',
+)
+
+_BOOL_FIELDS = (
+    'store_highlight', 'has_bids', 'has_received_bids_or_proposals', 'is_removed',
+    'is_stabbed', 'is_subjudice', 'is_sold', 'is_reserved', 'is_closed', 'is_highlight',
+    'is_favorite', 'allows_credit_card', 'allows_credit_card_total', 'has_bid',
+)
+
+_DT_FIELDS = (
+    'auction_begin_date', 'auction_end_date', 'auction_max_enddate', 'end_date',
+    'create_at', 'update_at', 'published_at', 'indexation_date',
+)
+
+_TRUE_STRINGS = ('true', '1', 'yes', 'sim')
+
+# Link público de uma oferta (fallback quando o item não traz 'link')
+_OFFER_URL = 'https://exchange.superbid.net/oferta/'
+
+# Colunas com poucas dezenas de valores distintos (internadas em _prepare_item)
+_INTERN_FIELDS = (
+    'category', 'categoria', 'product_type_desc', 'sub_category_desc', 'state',
+    'auction_modality', 'fuel', 'transmission', 'color',
+)
+
+# Limites do batch adaptativo do upsert
+_MIN_BATCH_SIZE = 100
+_MAX_BATCH_SIZE = 4000
+
+
+# ============================================
+# HELPERS DE CONVERSÃO (usados por _prepare_item)
+# ============================================
+
+# Timestamp ISO sem fração, com dia <= 28 (sempre válido em qualquer mês)
+_ISO_CANONICAL_RE = re.compile(
+    r'(?!0000)\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|1\d|2[0-8])'
+    r'T(?:[01]\d|2[0-3]):[0-5]\d:[0-5]\d'
+    r'(?:Z|[+-](?:[01]\d|2[0-3]):[0-5]\d)?'
+)
+
+
+@lru_cache(maxsize=None)
+def _split_path(path: str) -> Tuple[str, ...]:
+    """'a.b.c' -> ('a', 'b', 'c') - cada caminho do schema é quebrado uma única vez"""
+    return tuple(path.split('.'))
+
+
+def _safe_int(val):
+    if val is None or val == '':
+        return None
+    try:
+        return int(val)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _safe_int64(val):
+    """_safe_int limitado ao intervalo do int64 (coluna Int64 do pandas)"""
+    n = _safe_int(val)
+    if n is None or not -2**63 <= n < 2**63:
+        return None
+    return n
+
+
+def _safe_float(val):
+    if val is None or val == '':
+        return None
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return None
+
+
+def _safe_bool(val):
+    if val is None:
+        return False
+    if isinstance(val, bool):
+        return val
+    return str(val).lower() in _TRUE_STRINGS
+
+
+def _safe_str(val):
+    if val is None or val == '':
+        return None
+    return str(val)
+
+
+def _safe_datetime(val):
+    if not val:
+        return None
+    return _parse_datetime(str(val))
+
+
+@lru_cache(maxsize=256)
+def _normalize_state(state: str) -> Optional[str]:
+    """UF com 2 caracteres após strip/upper - cacheado (poucos valores distintos)"""
+    state = state.strip().upper()
+    return state if len(state) == 2 else None
+
+
+@lru_cache(maxsize=8192)
+def _parse_datetime(dt_str: str) -> Optional[str]:
+    """Normaliza timestamp ISO - cacheado (datas do leilão se repetem entre ofertas)"""
+    # Já canônico: a volta por datetime devolveria a mesma string
+    if _ISO_CANONICAL_RE.fullmatch(dt_str) and not dt_str.endswith('-00:00'):
+        return dt_str[:-1] + '+00:00' if dt_str[-1] == 'Z' else dt_str
+    try:
+        return datetime.fromisoformat(dt_str).isoformat()  # 3.11+: aceita sufixo Z
+    except ValueError:
+        return None
+
+
+# Propriedades do product.template -> (coluna, conversor)
+_TEMPLATE_FIELDS = {
+    'anofabricacao': ('year_manufacture', _safe_int),
+    'anomodelo': ('year_model', _safe_int),
+    'placa': ('plate', _safe_str),
+    'cor': ('color', _safe_str),
+    'combustivel': ('fuel', _safe_str),
+    'cambio': ('transmission', _safe_str),
+    'km': ('km', _safe_int),
+    'quilometragem': ('km', _safe_int),
+    'restricoes': ('vehicle_restrictions', _safe_str),
+    'restricao': ('vehicle_restrictions', _safe_str),
+    'proprietario': ('vehicle_owner', _safe_str),
+    'dono': ('vehicle_owner', _safe_str),
+    'debitos': ('vehicle_debts', _safe_str),
+    'dividas': ('vehicle_debts', _safe_str),
+}
 
 
 class SupabaseSuperbid:
     """Cliente Supabase para schema real superbid_items com heartbeat integrado"""
     
-    def __init__(self, service_name: str = 'superbid_scraper'):
+    def __init__(self, service_name: str = 'superbid_scraper', raw_http: bool = True):
         self.url = os.getenv('SUPABASE_URL')
         self.key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
         
@@ -41,6 +214,23 @@ class SupabaseSuperbid:
         self.session = requests.Session()
         self.session.headers.update(self.headers)
         
+        # ============================================
+        # HTTP DIRETO - conexão persistente para o loop de upsert
+        # (raw_http=False usa o requests.Session como antes)
+        # ============================================
+        self.raw_http = raw_http
+        parsed = urlsplit(self.url)
+        self._conn_scheme = parsed.scheme
+        self._conn_host = parsed.hostname
+        self._conn_port = parsed.port
+        self._upsert_path = f"{parsed.path}/rest/v1/{self.table}"
+        self._raw_headers = {**self.headers, 'Connection': 'keep-alive'}
+        self._conn = None
+        
+        # Batch adaptativo - aprende o tamanho ideal ao longo da execução
+        self.batch_size = 500
+        self.throughput_history = deque(maxlen=10)
+        
         # ============================================
         # HEARTBEAT - Configuração
         # ============================================
@@ -96,7 +286,7 @@ class SupabaseSuperbid:
             }
             
             url = f"{self.url}/rest/v1/infra_actions?on_conflict=service_name"
-            r = self.session.post(url, json=[payload], headers=heartbeat_headers, timeout=30)
+            r = self.session.post(url, data=_dumps([payload]), headers=heartbeat_headers, timeout=30)
             
             return r.status_code in (200, 201)
                 
@@ -153,7 +343,8 @@ class SupabaseSuperbid:
         logs = {
             'event': 'error',
             'error_type': type(error).__name__,
-            'traceback': traceback.format_exc(),
+            # Do próprio erro (vale também fora do bloco except em que foi capturado)
+            'traceback': ''.join(traceback.format_exception(error)),
             'context': context
         }
         
@@ -182,24 +373,115 @@ class SupabaseSuperbid:
     # MÉTODOS ORIGINAIS SUPERBID
     # ============================================
     
-    def upsert(self, items: List[Dict]) -> Dict:
-        """Upsert de itens na tabela"""
+    def upsert(self, items: List[Dict], prevalidated: bool = False) -> Dict:
+        """
+        Upsert de itens na tabela.
+        
+        prevalidated=True: os itens já estão no formato do schema (chaves = colunas,
+        tipos nativos) e pulam o _prepare_item - só recebem last_scraped_at, is_active e source.
+        """
         if not items:
             return {'inserted': 0, 'updated': 0, 'errors': 0}
         
+        # Mesmo timestamp para todo o lote (evita datetime.now() por item)
+        now_iso = datetime.now().isoformat()
+        
+        if prevalidated:
+            prepared = [
+                {**it, 'last_scraped_at': now_iso, 'is_active': True,
+                 'source': it.get('source', 'superbid')}
+                for it in items
+            ]
+            print(f"\n📤 {len(prepared)} itens pré-validados para inserção...")
+            return self._send_batches(prepared, len(prepared))
+        
         print(f"\n📤 Preparando {len(items)} itens para inserção...")
         
-        prepared = []
-        errors = 0
-        for item in items:
-            try:
-                db_item = self._prepare_item(item)
+        # Preparo sob demanda: cada batch é preparado enquanto o anterior está sendo enviado
+        prep = {'ok': 0, 'errors': 0}
+        
+        def prepared_rows():
+            for item in items:
+                try:
+                    db_item = self._prepare_item(item, now_iso)
+                except Exception as e:
+                    prep['errors'] += 1
+                    if prep['errors'] <= 5:  # Mostra só primeiros 5 erros
+                        print(f"  ⚠️  Erro ao preparar: {str(e)[:100]}")
+                    continue
                 if db_item:
-                    prepared.append(db_item)
-            except Exception as e:
-                errors += 1
-                if errors <= 5:  # Mostra só primeiros 5 erros
-                    print(f"  ⚠️  Erro ao preparar: {str(e)[:100]}")
+                    prep['ok'] += 1
+                    yield db_item
+        
+        stats = self._send_batches(prepared_rows(), len(items))
+        
+        if not prep['ok']:
+            print("  ⚠️  Nenhum item válido para inserir")
+            return {'inserted': 0, 'updated': 0, 'errors': prep['errors']}
+        
+        print(f"✅ {prep['ok']} itens preparados ({prep['errors']} erros)")
+        
+        return stats
+    
+    def upsert_df(self, df) -> Dict:
+        """
+        Upsert de um DataFrame já no formato do schema (colunas = campos da tabela).
+        Coerção numérica/booleana/datas feita por coluna (vetorizada) em vez de item a item.
+        """
+        try:
+            import numpy as np
+            import pandas as pd
+        except ImportError:
+            raise ImportError("❌ upsert_df requer pandas (pip install pandas)")
+        
+        if df is None or df.empty:
+            return {'inserted': 0, 'updated': 0, 'errors': 0}
+        
+        print(f"\n📤 Preparando {len(df)} linhas (DataFrame) para inserção...")
+        
+        df = df.copy()
+        columns = set(df.columns)
+        
+        for col in _INT_FIELDS:
+            if col in columns:
+                if df[col].dtype.kind in 'iufb':
+                    values = pd.to_numeric(df[col], errors='coerce')
+                    if values.dtype.kind != 'i':
+                        # Como _safe_int: frações truncadas; inf/NaN/fora do int64 -> null
+                        values = np.trunc(values.astype('float64'))
+                        values = values.where(np.isfinite(values) & (values.abs() < 2**63))
+                else:
+                    # Texto/misto: mesma regra de _safe_int ('12.5', '1e3' -> null)
+                    values = df[col].map(_safe_int64, na_action='ignore')
+                df[col] = values.astype('Int64')
+        
+        for col in _FLOAT_FIELDS:
+            if col in columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+        
+        for col in _BOOL_FIELDS:
+            if col in columns:
+                df[col] = df[col].fillna(False).astype(str).str.lower().isin(_TRUE_STRINGS)
+        
+        # Datas pela mesma normalização dos itens (cacheada): mantém fuso/naive e frações
+        for col in _DT_FIELDS:
+            if col in columns:
+                df[col] = df[col].map(_safe_datetime, na_action='ignore')
+        
+        # offer_id e external_id são NOT NULL
+        required = [c for c in ('external_id', 'offer_id') if c in columns]
+        total = len(df)
+        if required:
+            df = df.dropna(subset=required)
+        errors = total - len(df)
+        
+        df['source'] = df['source'].fillna('superbid') if 'source' in columns else 'superbid'
+        df['is_active'] = True
+        df['last_scraped_at'] = datetime.now().isoformat()
+        
+        # NaN/NA/NaT -> None (JSON null)
+        df = df.astype(object).where(df.notna(), None)
+        prepared = df.to_dict(orient='records')
         
         if not prepared:
             print("  ⚠️  Nenhum item válido para inserir")
@@ -207,49 +489,168 @@ class SupabaseSuperbid:
         
         print(f"✅ {len(prepared)} itens preparados ({errors} erros)")
         
-        # Insere em batches
+        return self._send_batches(prepared, len(prepared))
+    
+    def _send_batches(self, rows: Iterable[Dict], total: int) -> Dict:
+        """
+        Envia itens preparados em batches (batch_size ajustado pelo throughput observado).
+        Pipeline: o POST de um batch roda em background enquanto o próximo é montado.
+        """
         stats = {'inserted': 0, 'updated': 0, 'errors': 0}
-        batch_size = 500
-        total_batches = (len(prepared) + batch_size - 1) // batch_size
-        
-        url = f"{self.url}/rest/v1/{self.table}"
-        
-        for i in range(0, len(prepared), batch_size):
-            batch = prepared[i:i+batch_size]
-            batch_num = (i // batch_size) + 1
-            
-            try:
-                r = self.session.post(url, json=batch, timeout=120)
+        rows = iter(rows)
+        sent = 0
+        batch_num = 0
+        pending = None
+        
+        with ThreadPoolExecutor(max_workers=1) as sender:
+            while True:
+                batch_size = self.batch_size
+                batch = list(islice(rows, batch_size))
                 
-                if r.status_code in (200, 201):
-                    stats['inserted'] += len(batch)
-                    print(f"  ✅ Batch {batch_num}/{total_batches}: {len(batch)} itens inseridos")
-                    
-                    # ✅ HEARTBEAT: Atualiza progresso a cada batch
-                    self.heartbeat_progress(
-                        items_processed=len(batch),
-                        custom_logs={'batch': batch_num, 'total_batches': total_batches}
-                    )
-                    
-                elif r.status_code == 409:
-                    stats['updated'] += len(batch)
-                    print(f"  🔄 Batch {batch_num}/{total_batches}: {len(batch)} atualizados")
+                if pending:
+                    self._finish_batch(*pending, stats=stats, sender=sender)
+                
+                if not batch:
+                    break
+                
+                batch_num += 1
+                sent += len(batch)
+                if len(batch) < batch_size:
+                    total_batches = batch_num
                 else:
-                    error_detail = r.text[:300] if r.text else 'Sem detalhes'
-                    print(f"  ❌ Batch {batch_num}: HTTP {r.status_code}")
-                    print(f"     {error_detail}")
-                    stats['errors'] += len(batch)
-            
-            except Exception as e:
-                print(f"  ❌ Batch {batch_num}: {str(e)[:100]}")
-                stats['errors'] += len(batch)
-            
-            if batch_num < total_batches:
-                time.sleep(0.5)
+                    total_batches = batch_num + (max(0, total - sent) + batch_size - 1) // batch_size
+                future = sender.submit(self._timed_post, batch, batch_num > 1)
+                pending = (future, batch, batch_num, total_batches, batch_size)
         
         return stats
     
-    def _prepare_item(self, item: Dict) -> Optional[Dict]:
+    def _timed_post(self, batch: List[Dict], throttle: bool) -> Tuple[int, str, float]:
+        """POST do batch (thread de envio) - retorna (status_code, corpo, segundos)"""
+        if throttle:
+            time.sleep(0.5)
+        started = time.perf_counter()
+        status_code, text = self._post_batch(batch)
+        return status_code, text, time.perf_counter() - started
+    
+    def _finish_batch(self, future, batch: List[Dict], batch_num: int, total_batches: int,
+                      batch_size: int, stats: Dict, sender: ThreadPoolExecutor):
+        """Contabiliza o resultado de um batch enviado e ajusta o batch_size"""
+        ok, elapsed, retriable = self._record_batch(future, batch, batch_num, total_batches, stats)
+        
+        # Último batch parcial não serve de medida
+        if not ok or len(batch) == batch_size:
+            self._tune_batch_size(len(batch), elapsed, ok)
+        
+        if not ok:
+            self._resend_split(sender, batch, batch_num, total_batches, f"{batch_num}", stats, retriable)
+    
+    def _record_batch(self, future, batch: List[Dict], batch_num: int, total_batches: int,
+                      stats: Dict, label: Optional[str] = None) -> Tuple[bool, float, bool]:
+        """
+        Contabiliza sucesso (inseridos/atualizados) de um POST.
+        Retorna (ok, segundos, reenviável); falhas não entram em stats aqui.
+        """
+        label = label or f"{batch_num}/{total_batches}"
+        
+        try:
+            status_code, text, elapsed = future.result()
+        except Exception as e:
+            print(f"  ❌ Batch {label}: {str(e)[:100]}")
+            return False, 0.0, True
+        
+        if status_code in (200, 201):
+            stats['inserted'] += len(batch)
+            print(f"  ✅ Batch {label}: {len(batch)} itens inseridos")
+            
+            # ✅ HEARTBEAT: Atualiza progresso a cada batch
+            self.heartbeat_progress(
+                items_processed=len(batch),
+                custom_logs={'batch': batch_num, 'total_batches': total_batches}
+            )
+            return True, elapsed, False
+        
+        if status_code == 409:
+            stats['updated'] += len(batch)
+            print(f"  🔄 Batch {label}: {len(batch)} atualizados")
+            return True, elapsed, False
+        
+        error_detail = text[:300] if text else 'Sem detalhes'
+        print(f"  ❌ Batch {label}: HTTP {status_code}")
+        print(f"     {error_detail}")
+        # Credencial/permissão não melhora com batches menores
+        return False, elapsed, status_code not in (401, 403)
+    
+    def _resend_split(self, sender: ThreadPoolExecutor, batch: List[Dict], batch_num: int,
+                      total_batches: int, label: str, stats: Dict, retriable: bool):
+        """
+        Batch que falhou (413, timeout, 5xx...) é reenviado em partes do batch_size reduzido;
+        só vira erro o que falhar já no tamanho mínimo.
+        """
+        if not retriable or len(batch) <= _MIN_BATCH_SIZE:
+            stats['errors'] += len(batch)
+            return
+        
+        size = min(self.batch_size, (len(batch) + 1) // 2)
+        print(f"  ↩️  Batch {label}: reenviando {len(batch)} itens em partes de {size}")
+        
+        for part_num, i in enumerate(range(0, len(batch), size), 1):
+            part = batch[i:i + size]
+            part_label = f"{label}.{part_num}"
+            future = sender.submit(self._timed_post, part, True)
+            ok, elapsed, part_retriable = self._record_batch(
+                future, part, batch_num, total_batches, stats, label=part_label
+            )
+            if not ok:
+                self._tune_batch_size(len(part), elapsed, ok)
+                self._resend_split(sender, part, batch_num, total_batches, part_label, stats, part_retriable)
+    
+    def _tune_batch_size(self, rows: int, elapsed: float, ok: bool):
+        """Ajusta batch_size: cresce enquanto o throughput (linhas/s) sobe, cai à metade se cair ou falhar"""
+        if not ok:
+            self.batch_size = max(_MIN_BATCH_SIZE, self.batch_size // 2)
+            return
+        
+        throughput = rows / max(elapsed, 1e-6)
+        history = sorted(r / max(e, 1e-6) for r, e in self.throughput_history)
+        self.throughput_history.append((rows, elapsed))
+        
+        if not history or throughput >= history[len(history) // 2]:
+            self.batch_size = min(_MAX_BATCH_SIZE, int(self.batch_size * 1.25))
+        else:
+            self.batch_size = max(_MIN_BATCH_SIZE, self.batch_size // 2)
+    
+    def _post_batch(self, batch: List[Dict]) -> Tuple[int, str]:
+        """POST de um batch na tabela - retorna (status_code, corpo)"""
+        if not self.raw_http:
+            r = self.session.post(f"{self.url}/rest/v1/{self.table}", data=_dumps(batch), timeout=120)
+            return r.status_code, r.text
+        
+        body = _dumps(batch)
+        
+        # Uma reconexão se o servidor fechou a conexão keep-alive
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = self._open_conn()
+            try:
+                self._conn.request('POST', self._upsert_path, body=body, headers=self._raw_headers)
+                resp = self._conn.getresponse()
+                return resp.status, resp.read().decode('utf-8', errors='replace')
+            except (ConnectionError, http.client.HTTPException):
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+    
+    def _open_conn(self) -> http.client.HTTPConnection:
+        """Abre conexão persistente com o host do Supabase"""
+        if self._conn_scheme == 'http':
+            return http.client.HTTPConnection(self._conn_host, self._conn_port, timeout=120)
+        return http.client.HTTPSConnection(
+            self._conn_host, self._conn_port, timeout=120,
+            context=ssl.create_default_context()
+        )
+    
+    def _prepare_item(self, item: Dict, scraped_at: Optional[str] = None) -> Optional[Dict]:
         """Extrai TODOS os campos do raw_data para schema real"""
         external_id = item.get('external_id')
         if not external_id:
@@ -262,9 +663,8 @@ class SupabaseSuperbid:
         # ==========================================
         def get(path: str, default=None) -> Any:
             """Extrai valor usando dot notation"""
-            keys = path.split('.')
             value = raw
-            for key in keys:
+            for key in _split_path(path):
                 if isinstance(value, dict):
                     value = value.get(key)
                 else:
@@ -273,74 +673,37 @@ class SupabaseSuperbid:
                     return default
             return value
         
-        def safe_int(val):
-            if val is None or val == '':
-                return None
-            try:
-                return int(val)
-            except:
-                return None
-        
-        def safe_float(val):
-            if val is None or val == '':
-                return None
-            try:
-                return float(val)
-            except:
-                return None
-        
-        def safe_bool(val):
-            if val is None:
-                return False
-            if isinstance(val, bool):
-                return val
-            return str(val).lower() in ('true', '1', 'yes', 'sim')
-        
-        def safe_str(val):
-            if val is None or val == '':
-                return None
-            return str(val)
-        
-        def safe_datetime(val):
-            if not val:
-                return None
-            try:
-                dt_str = str(val).replace('Z', '+00:00')
-                return datetime.fromisoformat(dt_str).isoformat()
-            except:
-                return None
-        
         # ==========================================
         # EXTRAÇÃO DE CAMPOS
         # ==========================================
         
         # IDs (obrigatórios e opcionais)
-        offer_id = safe_int(get('id'))
+        offer_id = _safe_int(get('id'))
         if not offer_id:
             return None  # offer_id é NOT NULL
         
-        product_id = safe_int(get('product.productId'))
-        auction_id = safe_int(get('auction.id'))
-        lot_number = safe_int(get('lotNumber'))
-        group_offer_id = safe_int(get('groupOffer.id'))
+        product_id = _safe_int(get('product.productId'))
+        auction_id = _safe_int(get('auction.id'))
+        lot_number = _safe_int(get('lotNumber'))
+        group_offer_id = _safe_int(get('groupOffer.id'))
         
         # Categoria e Tipo
-        category = safe_str(get('product.subCategory.category.description'))
-        product_type_id = safe_int(get('product.productType.id'))
-        product_type_desc = safe_str(get('product.productType.description'))
-        sub_category_id = safe_int(get('product.subCategory.id'))
-        sub_category_desc = safe_str(get('product.subCategory.description'))
+        category = _safe_str(get('product.subCategory.category.description'))
+        product_type_id = _safe_int(get('product.productType.id'))
+        product_type_desc = _safe_str(get('product.productType.description'))
+        sub_category_id = _safe_int(get('product.subCategory.id'))
+        sub_category_desc = _safe_str(get('product.subCategory.description'))
         
         # Básico
-        title = safe_str(get('product.shortDesc', 'Sem Título'))
+        title = _safe_str(get('product.shortDesc', 'Sem Título'))
         if not title:
             title = 'Sem Título'
         
-        description = safe_str(get('product.detailedDescription'))
+        description = _safe_str(get('product.detailedDescription'))
         
         # Localização
-        location_city = safe_str(get('product.location.city'))
-        location_state = safe_str(get('product.location.state'))
+        location_city = _safe_str(get('product.location.city'))
+        location_state = _safe_str(get('product.location.state'))
         location_full = location_city
         
         # Monta location_full (usado pelo trigger extract_city_state_superbid)
@@ -350,25 +713,23 @@ class SupabaseSuperbid:
         # State validado (2 caracteres uppercase)
         state = None
         if location_state:
-            state_str = str(location_state).strip().upper()
-            if len(state_str) == 2:
-                state = state_str
+            state = _normalize_state(str(location_state))
         
         # Coordenadas
-        location_lat = safe_float(get('product.location.locationGeo.lat'))
-        location_lon = safe_float(get('product.location.locationGeo.lon'))
+        location_lat = _safe_float(get('product.location.locationGeo.lat'))
+        location_lon = _safe_float(get('product.location.locationGeo.lon'))
         
         # Auction
-        auction_name = safe_str(get('auction.desc'))
-        auction_status_id = safe_int(get('auction.statusId'))
-        auction_modality = safe_str(get('auction.modalityDesc'))
-        auction_begin_date = safe_datetime(get('auction.beginDate'))
-        auction_end_date = safe_datetime(get('auction.endDate'))
-        auction_max_enddate = safe_datetime(get('auction.maxEnddateOffer'))
+        auction_name = _safe_str(get('auction.desc'))
+        auction_status_id = _safe_int(get('auction.statusId'))
+        auction_modality = _safe_str(get('auction.modalityDesc'))
+        auction_begin_date = _safe_datetime(get('auction.beginDate'))
+        auction_end_date = _safe_datetime(get('auction.endDate'))
+        auction_max_enddate = _safe_datetime(get('auction.maxEnddateOffer'))
         
         # Auctioneer
-        auctioneer_name = safe_str(get('auction.auctioneer'))
-        auctioneer_registry = safe_str(get('auction.registry'))
+        auctioneer_name = _safe_str(get('auction.auctioneer'))
+        auctioneer_registry = _safe_str(get('auction.registry'))
         
         # Auction Address (JSONB)
         auction_address = get('auction.address')
@@ -376,131 +737,102 @@ class SupabaseSuperbid:
             auction_address = None
         
         # Judicial
-        judicial_praca = safe_int(get('auction.judicialPraca'))
-        judicial_praca_desc = safe_str(get('auction.judicialPracaDescription'))
-        judicial_control_number = safe_str(get('auction.judicialControlNumber'))
+        judicial_praca = _safe_int(get('auction.judicialPraca'))
+        judicial_praca_desc = _safe_str(get('auction.judicialPracaDescription'))
+        judicial_control_number = _safe_str(get('auction.judicialControlNumber'))
         
         # Store
-        store_id = safe_int(get('store.id'))
-        store_name = safe_str(get('store.name'))
-        store_highlight = safe_bool(get('store.highlight'))
-        store_logo_url = safe_str(get('store.logoUri'))
+        store_id = _safe_int(get('store.id'))
+        store_name = _safe_str(get('store.name'))
+        store_highlight = _safe_bool(get('store.highlight'))
+        store_logo_url = _safe_str(get('store.logoUri'))
         
         # Manager
-        manager_id = safe_int(get('manager.id'))
-        manager_name = safe_str(get('manager.name'))
+        manager_id = _safe_int(get('manager.id'))
+        manager_name = _safe_str(get('manager.name'))
         
         # Valores
-        price = safe_float(get('price'))
-        price_formatted = safe_str(get('priceFormatted'))
-        initial_bid_value = safe_float(get('offerDetail.initialBidValue'))
-        current_min_bid = safe_float(get('offerDetail.currentMinBid'))
-        current_max_bid = safe_float(get('offerDetail.currentMaxBid'))
-        reserved_price = safe_float(get('offerDetail.reservedPrice'))
-        bid_increment = safe_float(get('currentBidIncrement.currentBidIncrement'))
+        price = _safe_float(get('price'))
+        price_formatted = _safe_str(get('priceFormatted'))
+        initial_bid_value = _safe_float(get('offerDetail.initialBidValue'))
+        current_min_bid = _safe_float(get('offerDetail.currentMinBid'))
+        current_max_bid = _safe_float(get('offerDetail.currentMaxBid'))
+        reserved_price = _safe_float(get('offerDetail.reservedPrice'))
+        bid_increment = _safe_float(get('currentBidIncrement.currentBidIncrement'))
         
         # Lances
-        has_bids = safe_bool(get('hasBids'))
-        has_received_bids_or_proposals = safe_bool(get('hasReceivedBidsOrProposals'))
-        total_bidders = safe_int(get('totalBidders')) or 0
-        total_bids = safe_int(get('totalBids')) or 0
-        total_received_proposals = safe_int(get('totalReceivedProposals')) or 0
+        has_bids = _safe_bool(get('hasBids'))
+        has_received_bids_or_proposals = _safe_bool(get('hasReceivedBidsOrProposals'))
+        total_bidders = _safe_int(get('totalBidders')) or 0
+        total_bids = _safe_int(get('totalBids')) or 0
+        total_received_proposals = _safe_int(get('totalReceivedProposals')) or 0
         
         # Winner
-        current_winner_id = safe_int(get('winnerBid.userId'))
-        current_winner_login = safe_str(get('winnerBid.userLogin'))
+        current_winner_id = _safe_int(get('winnerBid.userId'))
+        current_winner_login = _safe_str(get('winnerBid.userLogin'))
         
         # Produto - Veículos (brand e model podem ser dict)
         brand_data = get('product.brand')
         if isinstance(brand_data, dict):
-            brand = safe_str(brand_data.get('description'))
+            brand = _safe_str(brand_data.get('description'))
         else:
-            brand = safe_str(brand_data)
+            brand = _safe_str(brand_data)
         
         model_data = get('product.model')
         if isinstance(model_data, dict):
-            model = safe_str(model_data.get('description'))
+            model = _safe_str(model_data.get('description'))
         else:
-            model = safe_str(model_data)
+            model = _safe_str(model_data)
         
         # Extrai características do template
-        year_manufacture = None
-        year_model = None
-        plate = None
-        color = None
-        fuel = None
-        transmission = None
-        km = None
-        vehicle_restrictions = None
-        vehicle_owner = None
-        vehicle_debts = None
-        
+        vehicle = {}
         template = get('product.template', {})
         if isinstance(template, dict):
             for group in template.get('groups', []):
                 for prop in group.get('properties', []):
-                    prop_id = str(prop.get('id', '')).lower()
                     value = prop.get('value')
-                    
                     if not value:
                         continue
                     
                     # Mapeamento de campos
-                    if prop_id == 'anofabricacao':
-                        year_manufacture = safe_int(value)
-                    elif prop_id == 'anomodelo':
-                        year_model = safe_int(value)
-                    elif prop_id == 'placa':
-                        plate = safe_str(value)
-                    elif prop_id == 'cor':
-                        color = safe_str(value)
-                    elif prop_id == 'combustivel':
-                        fuel = safe_str(value)
-                    elif prop_id == 'cambio':
-                        transmission = safe_str(value)
-                    elif prop_id in ('km', 'quilometragem'):
-                        km = safe_int(value)
-                    elif prop_id in ('restricoes', 'restricao'):
-                        vehicle_restrictions = safe_str(value)
-                    elif prop_id in ('proprietario', 'dono'):
-                        vehicle_owner = safe_str(value)
-                    elif prop_id in ('debitos', 'dividas'):
-                        vehicle_debts = safe_str(value)
+                    field = _TEMPLATE_FIELDS.get(str(prop.get('id', '')).lower())
+                    if field:
+                        vehicle[field[0]] = field[1](value)
         
         # Product ref
-        product_your_ref = safe_str(get('product.productYourRef'))
+        product_your_ref = _safe_str(get('product.productYourRef'))
         
         # Imagens
-        image_url = safe_str(get('product.thumbnailUrl'))
-        photo_count = safe_int(get('product.photoCount')) or 0
-        video_url_count = safe_int(get('product.videoUrlCount')) or 0
+        image_url = _safe_str(get('product.thumbnailUrl'))
+        photo_count = _safe_int(get('product.photoCount')) or 0
+        video_url_count = _safe_int(get('product.videoUrlCount')) or 0
         
         # Status Offer
-        offer_status_id = safe_int(get('statusId'))
-        offer_type_id = safe_int(get('offerTypeId'))
-        status_code = safe_int(get('offerStatus.statusCode'))
-        is_removed = safe_bool(get('offerStatus.removed'))
-        is_stabbed = safe_bool(get('offerStatus.stabbed'))
-        is_subjudice = safe_bool(get('offerStatus.subjudice'))
-        is_sold = safe_bool(get('offerStatus.sold'))
-        is_reserved = safe_bool(get('offerStatus.reserved'))
-        is_closed = safe_bool(get('offerStatus.closed'))
-        is_highlight = safe_bool(get('store.highlight'))
-        is_favorite = safe_bool(get('isFavorite'))
+        offer_status_id = _safe_int(get('statusId'))
+        offer_type_id = _safe_int(get('offerTypeId'))
+        status_code = _safe_int(get('offerStatus.statusCode'))
+        is_removed = _safe_bool(get('offerStatus.removed'))
+        is_stabbed = _safe_bool(get('offerStatus.stabbed'))
+        is_subjudice = _safe_bool(get('offerStatus.subjudice'))
+        is_sold = _safe_bool(get('offerStatus.sold'))
+        is_reserved = _safe_bool(get('offerStatus.reserved'))
+        is_closed = _safe_bool(get('offerStatus.closed'))
+        is_highlight = store_highlight
+        is_favorite = _safe_bool(get('isFavorite'))
         
         # Quantidades
-        quantity_in_lot = safe_int(get('quantityInLot')) or 1
-        quantity_sold = safe_int(get('quantitySold')) or 0
-        quantity_reserved = safe_int(get('quantityReserved')) or 0
+        quantity_in_lot = _safe_int(get('quantityInLot')) or 1
+        quantity_sold = _safe_int(get('quantitySold')) or 0
+        quantity_reserved = _safe_int(get('quantityReserved')) or 0
         
         # Métricas
-        system_metric = safe_str(get('systemMetric'))
-        visits = safe_int(get('visits')) or 0
+        system_metric = _safe_str(get('systemMetric'))
+        visits = _safe_int(get('visits')) or 0
         
         # Seller
-        seller_id = safe_int(get('seller.id'))
-        seller_name = safe_str(get('seller.name'))
-        seller_city = safe_str(get('seller.city'))
+        seller_id = _safe_int(get('seller.id'))
+        seller_name = _safe_str(get('seller.name'))
+        seller_city = _safe_str(get('seller.city'))
         
         # Seller phone (JSONB)
         seller_phone = get('seller.phone')
@@ -513,24 +845,24 @@ class SupabaseSuperbid:
             seller_company = None
         
         # Commercial
-        commission_percent = safe_float(get('groupOffer.commissionPercent'))
-        allows_credit_card = safe_bool(get('commercialCondition.allowsCreditCard'))
-        allows_credit_card_total = safe_bool(get('commercialCondition.allowCreditCardTotalValue'))
-        transaction_limit = safe_float(get('commercialCondition.transactionLimit'))
-        max_installments = safe_int(get('commercialCondition.maxInstallments'))
+        commission_percent = _safe_float(get('groupOffer.commissionPercent'))
+        allows_credit_card = _safe_bool(get('commercialCondition.allowsCreditCard'))
+        allows_credit_card_total = _safe_bool(get('commercialCondition.allowCreditCardTotalValue'))
+        transaction_limit = _safe_float(get('commercialCondition.transactionLimit'))
+        max_installments = _safe_int(get('commercialCondition.maxInstallments'))
         
         # Datas
-        end_date = safe_datetime(get('endDate'))
-        end_date_time = safe_int(get('endDateTime'))
-        create_at = safe_datetime(get('createAt'))
-        update_at = safe_datetime(get('updateAt'))
-        published_at = safe_datetime(get('publishedAt'))
-        indexation_date = safe_datetime(get('indexationDate'))
+        end_date = _safe_datetime(get('endDate'))
+        end_date_time = _safe_int(get('endDateTime'))
+        create_at = _safe_datetime(get('createAt'))
+        update_at = _safe_datetime(get('updateAt'))
+        published_at = _safe_datetime(get('publishedAt'))
+        indexation_date = _safe_datetime(get('indexationDate'))
         
         # Link (obrigatório)
         link = item.get('link')
         if not link:
-            link = f"https://exchange.superbid.net/oferta/{offer_id}"
+            link = f"{_OFFER_URL}{offer_id}"
         
         # ==========================================
         # METADATA (dados adicionais e complexos)
@@ -577,7 +909,7 @@ class SupabaseSuperbid:
         # ==========================================
         # RETORNO (todos os campos do schema)
         # ==========================================
-        return {
+        data = {
             'external_id': external_id,
             'offer_id': offer_id,
             'product_id': product_id,
@@ -586,7 +918,7 @@ class SupabaseSuperbid:
             'group_offer_id': group_offer_id,
             
             'category': category,
-            'categoria': safe_str(item.get('categoria', 'Outros')),  # ✅ categoria refinada (10 categorias)
+            'categoria': _safe_str(item.get('categoria', 'Outros')),  # ✅ categoria refinada (10 categorias)
             'product_type_id': product_type_id,
             'product_type_desc': product_type_desc,
             'sub_category_id': sub_category_id,
@@ -643,16 +975,16 @@ class SupabaseSuperbid:
             
             'brand': brand,
             'model': model,
-            'year_manufacture': year_manufacture,
-            'year_model': year_model,
-            'plate': plate,
-            'color': color,
-            'fuel': fuel,
-            'transmission': transmission,
-            'km': km,
-            'vehicle_restrictions': vehicle_restrictions,
-            'vehicle_owner': vehicle_owner,
-            'vehicle_debts': vehicle_debts,
+            'year_manufacture': vehicle.get('year_manufacture'),
+            'year_model': vehicle.get('year_model'),
+            'plate': vehicle.get('plate'),
+            'color': vehicle.get('color'),
+            'fuel': vehicle.get('fuel'),
+            'transmission': vehicle.get('transmission'),
+            'km': vehicle.get('km'),
+            'vehicle_restrictions': vehicle.get('vehicle_restrictions'),
+            'vehicle_owner': vehicle.get('vehicle_owner'),
+            'vehicle_debts': vehicle.get('vehicle_debts'),
             'product_your_ref': product_your_ref,
             
             'image_url': image_url,
@@ -702,12 +1034,22 @@ class SupabaseSuperbid:
             'metadata': metadata,
             'is_active': True,
             'has_bid': has_bids,
-            'last_scraped_at': datetime.now().isoformat(),
+            'last_scraped_at': scraped_at or datetime.now().isoformat(),
         }
+        
+        # Colunas de baixa cardinalidade: uma única instância de str por valor
+        for key in _INTERN_FIELDS:
+            value = data[key]
+            if value:
+                data[key] = sys.intern(value)
+        
+        return data
     
     def __del__(self):
         if hasattr(self, 'session'):
             self.session.close()
+        if getattr(self, '_conn', None) is not None:
+            self._conn.close()
 
 
 if __name__ == "__main__":
@@ -10,19 +10,193 @@ SUPERBID SCRAPER - OTIMIZADO PARA ML + HEARTBEAT + CATEGORIAS NORMALIZADAS
 """
 
 import sys
-import json
+import gzip
+import math
 import time
+import random
 import os
 import requests
+import queue
+import atexit
+import logging
+import threading
+from collections import Counter
+from requests.adapters import HTTPAdapter
+from types import MappingProxyType
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Set, Callable, Tuple
+
+try:
+    import orjson  # parser/serializer em C (opcional)
+except ImportError:
+    orjson = None
+
+# Brotli: o urllib3 só decodifica 'br' com brotli/brotlicffi instalado
+try:
+    import brotli  # noqa: F401
+    _ACCEPT_ENCODING = 'br, gzip, deflate'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        _ACCEPT_ENCODING = 'br, gzip, deflate'
+    except ImportError:
+        _ACCEPT_ENCODING = 'gzip, deflate'
+
+
+# Progresso por página em DEBUG; por categoria em INFO (nível via SUPERBID_LOG_LEVEL)
+logger = logging.getLogger('superbid')
 
 # Importa o cliente Supabase (da pasta pai)
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from supabase_client import SupabaseSuperbid
+from supabase_client import SupabaseSuperbid, _dumps  # mesmo serializer JSON do upload
+
+
+class NdjsonWriter:
+    """Backup local escrito incrementalmente: NDJSON (1 item JSON por linha), gzip se .gz"""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.count = 0
+        if path.suffix == '.gz':
+            # Nível baixo: compressão em streaming sem virar gargalo do scraping
+            self._file = gzip.open(path, 'wb', compresslevel=3)
+        else:
+            self._file = open(path, 'wb')
+    
+    def write(self, items: List[Dict]):
+        f = self._file
+        for item in items:
+            f.write(_dumps(item))
+            f.write(b'\n')
+        self.count += len(items)
+    
+    def close(self):
+        self._file.close()
+
+
+# 18 CATEGORIAS PRINCIPAIS: (slug da URL, nome de exibição) - imutável, compartilhada
+CATEGORIES = (
+    ('alimentos-e-bebidas', 'Alimentos e Bebidas'),
+    ('animais', 'Animais'),
+    ('bolsas-canetas-joias-e-relogios', 'Bolsas, Canetas, Joias e Relógios'),
+    ('caminhoes-onibus', 'Caminhões e Ônibus'),
+    ('carros-motos', 'Carros e Motos'),
+    ('cozinhas-e-restaurantes', 'Cozinhas e Restaurantes'),
+    ('eletrodomesticos', 'Eletrodomésticos'),
+    ('materiais-para-construcao-civil', 'Materiais para Construção Civil'),
+    ('maquinas-pesadas-agricolas', 'Máquinas Pesadas e Agrícolas'),
+    ('industrial-maquinas-equipamentos', 'Industrial, Máquinas e Equipamentos'),
+    ('imoveis', 'Imóveis'),
+    ('embarcacoes-aeronaves', 'Embarcações e Aeronaves'),
+    ('moveis-e-decoracao', 'Móveis e Decoração'),
+    ('movimentacao-transporte', 'Movimentação e Transporte'),
+    ('oportunidades', 'Oportunidades'),
+    ('partes-e-pecas', 'Partes e Peças'),
+    ('sucatas-materiais-residuos', 'Sucatas, Materiais e Resíduos'),
+    ('tecnologia', 'Tecnologia'),
+)
+
+
+class TokenBucket:
+    """Limitador de taxa por host (thread-safe): `rate` req/s com rajada de até `burst`"""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+    
+    def acquire(self):
+        """Bloqueia até haver um token disponível"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+    
+    def set_rate(self, rate: float):
+        """Troca a taxa (tokens já acumulados contam pela taxa anterior)"""
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+
+# ========================================
+# MAPEAMENTO COMPLETO: 19 CATEGORIAS → 10 CATEGORIAS NORMALIZADAS
+# ========================================
+CATEGORY_MAPPING = MappingProxyType({
+    # 1️⃣ IMÓVEIS
+    'Imóveis': 'Imóveis',
+    
+    # 2️⃣ VEÍCULOS (Carro, moto, caminhão, ônibus, embarcação)
+    'Carros & Motos': 'Veículos',
+    'Carros e Motos': 'Veículos',
+    'Caminhões & Ônibus': 'Veículos',
+    'Caminhões e Ônibus': 'Veículos',
+    'Embarcações & Aeronaves': 'Veículos',
+    'Embarcações e Aeronaves': 'Veículos',
+    
+    # 3️⃣ MÁQUINAS & EQUIPAMENTOS (Agrícola, Industrial, Pesada, Movimentação)
+    'Máquinas Pesadas & Agrícolas': 'Máquinas & Equipamentos',
+    'Máquinas Pesadas e Agrícolas': 'Máquinas & Equipamentos',
+    'Industrial, Máquinas & Equipamentos': 'Máquinas & Equipamentos',
+    'Industrial, Máquinas e Equipamentos': 'Máquinas & Equipamentos',
+    'Movimentação & Transporte': 'Máquinas & Equipamentos',
+    'Movimentação e Transporte': 'Máquinas & Equipamentos',
+    
+    # 4️⃣ TECNOLOGIA (Eletrônicos, Informática, Celulares, Tech, Eletroportáteis)
+    'Tecnologia': 'Tecnologia',
+    
+    # 5️⃣ CASA & CONSUMO (Móveis, Decoração, Eletrodomésticos, Utilidades domésticas)
+    'Eletrodomésticos': 'Casa & Consumo',
+    'Móveis e Decoração': 'Casa & Consumo',
+    'Móveis & Decoração': 'Casa & Consumo',
+    'Alimentos e Bebidas': 'Casa & Consumo',
+    'Alimentos & Bebidas': 'Casa & Consumo',
+    
+    # 6️⃣ INDUSTRIAL & EMPRESARIAL (Equipamentos comerciais, Cozinhas industriais, Estoques, Partes & peças)
+    'Cozinhas e Restaurantes': 'Industrial & Empresarial',
+    'Cozinhas & Restaurantes': 'Industrial & Empresarial',
+    'Partes e Peças': 'Industrial & Empresarial',
+    'Partes e Peças ': 'Industrial & Empresarial',  # com espaço no final
+    'Partes & Peças': 'Industrial & Empresarial',
+    'Spare Parts': 'Industrial & Empresarial',
+    'Spare Parts ': 'Industrial & Empresarial',  # com espaço no final
+    
+    # 7️⃣ MATERIAIS & SUCATAS (Resíduo, lote, material bruto)
+    'Sucatas, Materiais & Resíduos': 'Materiais & Sucatas',
+    'Sucatas , Materiais & Resíduos': 'Materiais & Sucatas',  # com espaço antes da vírgula
+    'Sucatas, Materiais e Resíduos': 'Materiais & Sucatas',
+    'Materiais para Construção Civil': 'Materiais & Sucatas',
+    
+    # 8️⃣ ANIMAIS
+    'Animais': 'Animais',
+    
+    # 9️⃣ ARTE & COLECIONÁVEIS (Arte, Relógios, Bolsas, Joias, Canetas, Colecionáveis)
+    'Bolsas, Canetas, Joias e Relógios': 'Arte & Colecionáveis',
+    'Bolsas, Canetas, Joias & Relógios': 'Arte & Colecionáveis',
+    
+    # 🔟 OUTROS
+    'Oportunidades': 'Outros',
+})
+
+
+# Itens por chamada de upsert no main (o cliente ainda divide em batches HTTP)
+UPLOAD_CHUNK_SIZE = 5000
 
 
 class SuperbidScraper:
@@ -32,92 +206,30 @@ class SuperbidScraper:
         self.source = 'superbid'
         self.base_url = 'https://offer-query.superbid.net/seo/offers/'
         self.site_url = 'https://exchange.superbid.net'
+        self.offer_url = f'{self.site_url}/oferta/'
         
-        # 18 CATEGORIAS PRINCIPAIS
-        self.categories = [
-            ('alimentos-e-bebidas', 'Alimentos e Bebidas'),
-            ('animais', 'Animais'),
-            ('bolsas-canetas-joias-e-relogios', 'Bolsas, Canetas, Joias e Relógios'),
-            ('caminhoes-onibus', 'Caminhões e Ônibus'),
-            ('carros-motos', 'Carros e Motos'),
-            ('cozinhas-e-restaurantes', 'Cozinhas e Restaurantes'),
-            ('eletrodomesticos', 'Eletrodomésticos'),
-            ('materiais-para-construcao-civil', 'Materiais para Construção Civil'),
-            ('maquinas-pesadas-agricolas', 'Máquinas Pesadas e Agrícolas'),
-            ('industrial-maquinas-equipamentos', 'Industrial, Máquinas e Equipamentos'),
-            ('imoveis', 'Imóveis'),
-            ('embarcacoes-aeronaves', 'Embarcações e Aeronaves'),
-            ('moveis-e-decoracao', 'Móveis e Decoração'),
-            ('movimentacao-transporte', 'Movimentação e Transporte'),
-            ('oportunidades', 'Oportunidades'),
-            ('partes-e-pecas', 'Partes e Peças'),
-            ('sucatas-materiais-residuos', 'Sucatas, Materiais e Resíduos'),
-            ('tecnologia', 'Tecnologia'),
-        ]
-        
-        # ========================================
-        # MAPEAMENTO COMPLETO: 19 CATEGORIAS → 10 CATEGORIAS NORMALIZADAS
-        # ========================================
-        self.category_mapping = {
-            # 1️⃣ IMÓVEIS
-            'Imóveis': 'Imóveis',
-            
-            # 2️⃣ VEÍCULOS (Carro, moto, caminhão, ônibus, embarcação)
-            'Carros & Motos': 'Veículos',
-            'Carros e Motos': 'Veículos',
-            'Caminhões & Ônibus': 'Veículos',
-            'Caminhões e Ônibus': 'Veículos',
-            'Embarcações & Aeronaves': 'Veículos',
-            'Embarcações e Aeronaves': 'Veículos',
-            
-            # 3️⃣ MÁQUINAS & EQUIPAMENTOS (Agrícola, Industrial, Pesada, Movimentação)
-            'Máquinas Pesadas & Agrícolas': 'Máquinas & Equipamentos',
-            'Máquinas Pesadas e Agrícolas': 'Máquinas & Equipamentos',
-            'Industrial, Máquinas & Equipamentos': 'Máquinas & Equipamentos',
-            'Industrial, Máquinas e Equipamentos': 'Máquinas & Equipamentos',
-            'Movimentação & Transporte': 'Máquinas & Equipamentos',
-            'Movimentação e Transporte': 'Máquinas & Equipamentos',
-            
-            # 4️⃣ TECNOLOGIA (Eletrônicos, Informática, Celulares, Tech, Eletroportáteis)
-            'Tecnologia': 'Tecnologia',
-            
-            # 5️⃣ CASA & CONSUMO (Móveis, Decoração, Eletrodomésticos, Utilidades domésticas)
-            'Eletrodomésticos': 'Casa & Consumo',
-            'Móveis e Decoração': 'Casa & Consumo',
-            'Móveis & Decoração': 'Casa & Consumo',
-            'Alimentos e Bebidas': 'Casa & Consumo',
-            'Alimentos & Bebidas': 'Casa & Consumo',
-            
-            # 6️⃣ INDUSTRIAL & EMPRESARIAL (Equipamentos comerciais, Cozinhas industriais, Estoques, Partes & peças)
-            'Cozinhas e Restaurantes': 'Industrial & Empresarial',
-            'Cozinhas & Restaurantes': 'Industrial & Empresarial',
-            'Partes e Peças': 'Industrial & Empresarial',
-            'Partes e Peças ': 'Industrial & Empresarial',  # com espaço no final
-            'Partes & Peças': 'Industrial & Empresarial',
-            'Spare Parts': 'Industrial & Empresarial',
-            'Spare Parts ': 'Industrial & Empresarial',  # com espaço no final
-            
-            # 7️⃣ MATERIAIS & SUCATAS (Resíduo, lote, material bruto)
-            'Sucatas, Materiais & Resíduos': 'Materiais & Sucatas',
-            'Sucatas , Materiais & Resíduos': 'Materiais & Sucatas',  # com espaço antes da vírgula
-            'Sucatas, Materiais e Resíduos': 'Materiais & Sucatas',
-            'Materiais para Construção Civil': 'Materiais & Sucatas',
-            
-            # 8️⃣ ANIMAIS
-            'Animais': 'Animais',
-            
-            # 9️⃣ ARTE & COLECIONÁVEIS (Arte, Relógios, Bolsas, Joias, Canetas, Colecionáveis)
-            'Bolsas, Canetas, Joias e Relógios': 'Arte & Colecionáveis',
-            'Bolsas, Canetas, Joias & Relógios': 'Arte & Colecionáveis',
-            
-            # 🔟 OUTROS
-            'Oportunidades': 'Outros',
+        self.categories = CATEGORIES
+        
+        # Parâmetros fixos da busca por categoria (por página só muda pageNumber/pageSize)
+        self._base_params = {
+            url_slug: {
+                "urlSeo": f"{self.site_url}/categorias/{url_slug}",
+                "locale": "pt_BR",
+                "orderBy": "score:desc",
+                "portalId": "[2,15]",
+                "requestOrigin": "marketplace",
+                "searchType": "opened" if url_slug == 'imoveis' else "openedAll",
+                "timeZoneId": "America/Sao_Paulo",
+            }
+            for url_slug, _ in self.categories
         }
         
+        self.category_mapping = CATEGORY_MAPPING
+        
         self.stats = {
             'total_scraped': 0,
             'by_category': {},
-            'by_categoria': {},  # estatísticas por categoria refinada (10 categorias)
+            'by_categoria': Counter(),  # estatísticas por categoria refinada (10 categorias)
             'duplicates': 0,
             'with_bids': 0,
             'errors': 0,
@@ -128,39 +240,96 @@ class SuperbidScraper:
             "accept-language": "pt-BR,pt;q=0.9",
             "origin": "https://exchange.superbid.net",
             "referer": "https://exchange.superbid.net/",
+            "accept-encoding": _ACCEPT_ENCODING,
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
         }
         
+        # Paralelismo entre categorias (threads compartilham session, ids e stats)
+        # Ajustável por env: SUPERBID_WORKERS (categorias) e SUPERBID_PAGE_WORKERS (páginas)
+        self.max_workers = max(1, int(os.getenv('SUPERBID_WORKERS', '6')))
+        self.page_workers = max(1, int(os.getenv('SUPERBID_PAGE_WORKERS', '4')))
+        
+        # Teto global de requisições simultâneas (categorias x páginas multiplicam as threads)
+        self.max_in_flight = max(1, int(os.getenv('SUPERBID_MAX_IN_FLIGHT', '16')))
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        
+        # Pool de conexões dimensionado para o teto de requisições (mesmo host)
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=self.max_in_flight,
+            # Sem retry no urllib3: toda nova tentativa passa pelo token bucket
+            # (_fetch_page_retry), senão 5xx seriam reenviados fora do limite
+            max_retries=0,
+        )
+        
         self.session = requests.Session()
         self.session.headers.update(self.headers)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        
+        # Teto de páginas por categoria (100 ofertas/página)
+        self.max_pages = 1000
+        
+        # Tentativas por página em caso de 429 + pausa global compartilhada
+        self.max_attempts = 5
+        self._pause_until = 0.0
+        
+        # Novas tentativas de uma página que falhou (5xx, conexão, timeout, JSON inválido)
+        self.page_retries = 3
+        
+        # Taxa de requisições ao host compartilhada por todas as threads (token bucket)
+        # AIMD: +0.1 req/s a cada sucesso, metade em 429/5xx; teto = 2x SUPERBID_RATE
+        self.min_rate = 0.5
+        base_rate = max(self.min_rate, float(os.getenv('SUPERBID_RATE', '2')))
+        self.max_rate = base_rate * 2
+        self.rate_step = 0.1
+        self.limiter = TokenBucket(rate=base_rate, burst=max(1, round(base_rate)))
+        
+        # Cache categoria original → categoria refinada
+        self._categoria_cache: Dict[str, str] = {}
     
     def _categorize_item(self, original_category: str) -> str:
         """
         Mapeia categoria original do Superbid para uma das 10 categorias refinadas.
         Trata variações com & vs e, espaços extras, etc.
         """
+        # Poucos valores distintos se repetem em todas as ofertas: normaliza 1x por valor
+        refined = self._categoria_cache.get(original_category)
+        if refined is None:
+            refined = self._categoria_cache[original_category] = self._map_category(original_category)
+        return refined
+    
+    @staticmethod
+    def _map_category(original_category: str) -> str:
+        """Normaliza e mapeia uma categoria original (sem cache)"""
         # Remove espaços extras no início e fim
         original_category = original_category.strip()
         
         # Busca no mapeamento
-        refined = self.category_mapping.get(original_category)
+        refined = CATEGORY_MAPPING.get(original_category)
         
         if refined:
             return refined
         
         # Se não encontrou exato, tenta normalizar (& vs e)
         normalized = original_category.replace(' e ', ' & ')
-        refined = self.category_mapping.get(normalized)
+        refined = CATEGORY_MAPPING.get(normalized)
         
         if refined:
             return refined
         
         # Fallback: retorna "Outros"
-        print(f"   ⚠️  Categoria não mapeada: '{original_category}'")
+        logger.warning(f"   ⚠️  Categoria não mapeada: '{original_category}'")
         return 'Outros'
     
-    def scrape(self) -> List[Dict]:
-        """Scrape completo de todas as categorias"""
+    def scrape(self, writer: Optional[NdjsonWriter] = None,
+               upload: Optional[Callable[[List[Dict]], None]] = None) -> List[Dict]:
+        """
+        Scrape completo de todas as categorias.
+        Com `writer`, cada categoria concluída já é gravada no backup enquanto as demais baixam.
+        Com `upload`, cada categoria concluída é entregue ao callback e liberada em seguida
+        (retorna lista vazia; total em stats['total_scraped']).
+        """
         print("\n" + "="*80)
         print("🔵 SUPERBID - SCRAPER OTIMIZADO PARA ML")
         print("="*80)
@@ -170,115 +339,271 @@ class SuperbidScraper:
         print("="*80 + "\n")
         
         all_items = []
-        global_ids = set()
+        total_scraped = 0
+        global_ids: Set[int] = set()  # offer_id (int) - hash trivial e menos memória que 'superbid_{id}'
+        total_categories = len(self.categories)
         
-        for idx, (url_slug, display_name) in enumerate(self.categories, 1):
-            print(f"\n[{idx}/{len(self.categories)}] 📦 {display_name}")
-            print(f"{'─'*80}")
-            
-            category_items = self._scrape_category(
-                url_slug, display_name, global_ids
-            )
-            
-            all_items.extend(category_items)
-            self.stats['by_category'][display_name] = len(category_items)
-            
-            # Conta por categoria refinada
-            for item in category_items:
-                categoria = item.get('categoria', 'Outros')
-                self.stats['by_categoria'][categoria] = \
-                    self.stats['by_categoria'].get(categoria, 0) + 1
-            
-            print(f"   ✅ {len(category_items)} itens coletados")
+        # Categorias em paralelo (I/O bound) - cada worker pagina a sua categoria
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._scrape_category, url_slug, display_name, global_ids): display_name
+                for url_slug, display_name in self.categories
+            }
             
-            time.sleep(2)
+            # pop: o Future concluído (e a lista de itens que ele guarda) não fica referenciado
+            for idx, future in enumerate(as_completed(futures), 1):
+                display_name = futures.pop(future)
+                try:
+                    category_items, pages, duplicates = future.result()
+                except Exception as e:
+                    # Falha inesperada numa categoria não derruba as demais
+                    with self._lock:
+                        self.stats['errors'] += 1
+                    logger.warning(f"   ⚠️  [{display_name}] Erro na categoria: {str(e)[:100]}")
+                    category_items, pages, duplicates = [], 0, 0
+                
+                total_scraped += len(category_items)
+                self.stats['by_category'][display_name] = len(category_items)
+                
+                if writer:
+                    writer.write(category_items)
+                
+                # Conta por categoria refinada
+                self.stats['by_categoria'].update(
+                    item.get('categoria', 'Outros') for item in category_items
+                )
+                
+                logger.info(f"[{idx}/{total_categories}] 📦 {display_name}: ✅ {len(category_items)} itens "
+                            f"({pages} páginas, {duplicates} duplicados)")
+                
+                if upload:
+                    upload(category_items)
+                else:
+                    all_items.extend(category_items)
         
-        self.stats['total_scraped'] = len(all_items)
+        self.stats['total_scraped'] = total_scraped
         return all_items
     
     def _scrape_category(self, url_slug: str, display_name: str, 
-                        global_ids: set) -> List[Dict]:
-        """Scrape completo de uma categoria (todas as páginas)"""
+                        global_ids: Set[int]) -> Tuple[List[Dict], int, int]:
+        """
+        Scrape completo de uma categoria (página 1 descobre o total, demais em paralelo).
+        Retorna (itens, páginas baixadas, duplicados).
+        """
         items = []
-        page_num = 1
         page_size = 100
-        consecutive_errors = 0
-        max_errors = 3
         
-        while True:
+        # Página 1 traz o total de ofertas da categoria
+        data = self._fetch_page_retry(url_slug, display_name, 1, page_size)
+        
+        if data is None:
+            logger.warning(f"   ⚠️  [{display_name}] Página 1 perdida após novas tentativas - categoria sem itens")
+            return items, 0, 0
+        if not data.get('offers'):
+            return items, 0, 0
+        
+        pages = 1
+        duplicates = self._collect_offers(data['offers'], display_name, global_ids, items)
+        
+        # Total informado pela API limita as páginas (sem total válido: segue até página incompleta)
+        try:
+            total_offers = int(data.get('total') or data.get('totalOffers') or 0)
+        except (TypeError, ValueError):
+            total_offers = 0
+        if total_offers <= 0:
+            page_num = 1
+            while len(data['offers']) >= page_size and page_num < self.max_pages:
+                page_num += 1
+                data = self._fetch_page_retry(url_slug, display_name, page_num, page_size)
+                if not data or not data.get('offers'):
+                    break
+                pages += 1
+                duplicates += self._collect_offers(data['offers'], display_name, global_ids, items)
+            return items, pages, duplicates
+        
+        last_page = min(self.max_pages, math.ceil(total_offers / page_size))
+        if last_page < 2:
+            return items, pages, duplicates
+        
+        def fetch(page_num: int) -> Optional[Dict]:
+            return self._fetch_page(url_slug, display_name, page_num, page_size)
+        
+        # Páginas 2..N em paralelo - dedup feito na ordem das páginas
+        failed = []
+        page_nums = range(2, last_page + 1)
+        with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+            for page_num, page_data in zip(page_nums, executor.map(fetch, page_nums)):
+                if page_data is None:
+                    failed.append(page_num)
+                elif page_data.get('offers'):
+                    pages += 1
+                    duplicates += self._collect_offers(page_data['offers'], display_name, global_ids, items)
+        
+        # Páginas que falharam ganham novas tentativas isoladas (sem refazer a categoria)
+        for page_num in failed:
+            page_data = self._fetch_page_retry(url_slug, display_name, page_num, page_size, first_try=False)
+            if page_data is None:
+                logger.warning(f"   ⚠️  [{display_name}] Página {page_num} perdida após novas tentativas")
+            elif page_data.get('offers'):
+                pages += 1
+                duplicates += self._collect_offers(page_data['offers'], display_name, global_ids, items)
+        
+        return items, pages, duplicates
+    
+    def _fetch_page_retry(self, url_slug: str, display_name: str, page_num: int,
+                          page_size: int, first_try: bool = True) -> Optional[Dict]:
+        """_fetch_page com até `page_retries` novas tentativas (backoff exponencial por tentativa)"""
+        if first_try:
+            data = self._fetch_page(url_slug, display_name, page_num, page_size)
+            if data is not None:
+                return data
+        
+        for attempt in range(self.page_retries):
+            time.sleep(self._retry_delay(None, attempt))
+            data = self._fetch_page(url_slug, display_name, page_num, page_size)
+            if data is not None:
+                return data
+        return None
+    
+    def _fetch_page(self, url_slug: str, display_name: str, 
+                    page_num: int, page_size: int) -> Optional[Dict]:
+        """Busca uma página da categoria (None em caso de erro)"""
+        params = {**self._base_params[url_slug], "pageNumber": page_num, "pageSize": page_size}
+        
+        # 5xx e falhas de conexão: retentados por _fetch_page_retry (via limiter)
+        # 429: pausa global aqui, pois o limite vale para todas as threads
+        for attempt in range(self.max_attempts):
+            self._wait_rate_limit()
+            self.limiter.acquire()
+            
             try:
-                params = {
-                    "urlSeo": f"{self.site_url}/categorias/{url_slug}",
-                    "locale": "pt_BR",
-                    "orderBy": "score:desc",
-                    "pageNumber": page_num,
-                    "pageSize": page_size,
-                    "portalId": "[2,15]",
-                    "requestOrigin": "marketplace",
-                    "searchType": "opened" if url_slug == 'imoveis' else "openedAll",
-                    "timeZoneId": "America/Sao_Paulo",
-                }
+                with self._in_flight:
+                    response = self.session.get(
+                        self.base_url,
+                        params=params,
+                        timeout=30
+                    )
                 
-                response = self.session.get(
-                    self.base_url,
-                    params=params,
-                    timeout=30
-                )
+                if response.status_code == 429 or response.status_code >= 500:
+                    self._adapt_rate(ok=False)
                 
-                if response.status_code != 200:
-                    consecutive_errors += 1
-                    print(f"   ⚠️  Erro HTTP {response.status_code} na página {page_num}")
-                    if consecutive_errors >= max_errors:
-                        break
-                    page_num += 1
-                    time.sleep(3)
+                if response.status_code == 429 and attempt + 1 < self.max_attempts:
+                    delay = self._retry_delay(response, attempt)
+                    logger.warning(f"   ⏳ [{display_name}] HTTP 429 na página {page_num} - pausando {delay:.1f}s")
+                    self._pause_all(delay)
                     continue
                 
-                data = response.json()
-                offers = data.get('offers', [])
-                total_offers = data.get('total', 0)
-                
-                if not offers:
-                    break
-                
-                consecutive_errors = 0
-                print(f"   📄 Página {page_num}: {len(offers)} ofertas (total: {total_offers})")
-                
-                page_items = 0
-                for offer_data in offers:
-                    item = self._parse_offer(offer_data, display_name)
-                    
-                    if item and item['external_id'] not in global_ids:
-                        items.append(item)
-                        global_ids.add(item['external_id'])
-                        page_items += 1
-                        
-                        if item.get('has_bids'):
-                            self.stats['with_bids'] += 1
-                    elif item:
-                        self.stats['duplicates'] += 1
-                
-                # Verifica se há mais páginas
-                start = data.get('start', 0)
-                limit = data.get('limit', page_size)
-                if start + limit >= total_offers:
-                    break
+                if response.status_code != 200:
+                    logger.warning(f"   ⚠️  [{display_name}] Erro HTTP {response.status_code} na página {page_num}")
+                    return None
                 
-                page_num += 1
-                time.sleep(1)
+                data = orjson.loads(response.content) if orjson else response.json()
+                if not isinstance(data, dict) or not isinstance(data.get('offers') or [], list):
+                    raise ValueError("resposta fora do formato esperado")
+                self._adapt_rate(ok=True)
+                break
                 
             except Exception as e:
-                consecutive_errors += 1
-                self.stats['errors'] += 1
-                print(f"   ⚠️  Erro: {str(e)[:100]}")
-                if consecutive_errors >= max_errors:
-                    break
-                page_num += 1
-                time.sleep(3)
+                with self._lock:
+                    self.stats['errors'] += 1
+                logger.warning(f"   ⚠️  [{display_name}] Erro na página {page_num}: {str(e)[:100]}")
+                return None
         
-        return items
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("   📄 [%s] Página %s: %s ofertas (total: %s)",
+                         display_name, page_num, len(data.get('offers') or []), data.get('total', 0))
+        return data
+    
+    def _adapt_rate(self, ok: bool):
+        """Ajusta a taxa do limitador (AIMD): +rate_step a cada sucesso, metade em 429/5xx"""
+        with self._lock:
+            rate = self.limiter.rate
+            if ok:
+                rate = min(self.max_rate, rate + self.rate_step)
+            else:
+                rate = max(self.min_rate, rate / 2)
+            self.limiter.set_rate(rate)
+    
+    def _wait_rate_limit(self):
+        """Aguarda pausa global ativa (após 429 do servidor)"""
+        with self._lock:
+            remaining = self._pause_until - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+    
+    def _pause_all(self, delay: float):
+        """Pausa todas as threads por `delay` segundos"""
+        with self._lock:
+            self._pause_until = max(self._pause_until, time.monotonic() + delay)
+        self._wait_rate_limit()
+    
+    @staticmethod
+    def _retry_delay(response, attempt: int) -> float:
+        """Espera antes de retentar: Retry-After do servidor ou backoff exponencial com jitter"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(60.0, max(0.0, float(retry_after)))
+                except ValueError:
+                    pass  # formato HTTP-date: usa o backoff
+        return min(60.0, 2 ** attempt + random.random())
     
-    def _parse_offer(self, offer: Dict, category_display: str) -> Optional[Dict]:
+    def _collect_offers(self, offers: List[Dict], display_name: str, 
+                        global_ids: Set[int], items: List[Dict]) -> int:
+        """Dedup global pelo id cru da oferta + parse só das ofertas novas (retorna nº de duplicados)"""
+        # Descarta entradas inválidas (não-dict, id ausente ou não hashable) sem derrubar a página
+        valid_offers = []
+        invalid = 0
+        for offer_data in offers:
+            try:
+                if offer_data.get('id'):
+                    hash(offer_data['id'])
+                    valid_offers.append(offer_data)
+            except (AttributeError, TypeError):
+                invalid += 1
+        
+        # Dedup global compartilhado entre as threads (antes de qualquer parse)
+        # Sob o lock só operações de conjunto em C: diferença + update do lote da página
+        page_ids = {offer_data['id'] for offer_data in valid_offers}
+        with self._lock:
+            fresh_ids = page_ids - global_ids
+            global_ids.update(fresh_ids)
+        
+        # Ofertas novas na ordem da página (repetição do mesmo id na página conta como duplicada)
+        new_offers = []
+        duplicates = 0
+        new_append = new_offers.append
+        take_id = fresh_ids.discard
+        for offer_data in valid_offers:
+            offer_id = offer_data['id']
+            if offer_id in fresh_ids:
+                take_id(offer_id)
+                new_append(offer_data)
+            else:
+                duplicates += 1
+        
+        # Aliases locais: evita lookup de atributo por oferta
+        parse = self._parse_offer
+        items_append = items.append
+        scraped_at = datetime.now().isoformat()  # 1x por página
+        with_bids = 0
+        for offer_data in new_offers:
+            item = parse(offer_data, display_name, scraped_at)
+            if item:
+                items_append(item)
+                if item['has_bids']:
+                    with_bids += 1
+        
+        with self._lock:
+            self.stats['with_bids'] += with_bids
+            self.stats['duplicates'] += duplicates
+            self.stats['errors'] += invalid
+        
+        return duplicates
+    
+    def _parse_offer(self, offer: Dict, category_display: str,
+                     scraped_at: Optional[str] = None) -> Optional[Dict]:
         """Parse - preserva raw_data completo e mapeia categoria"""
         try:
             offer_id = offer.get('id')
@@ -292,30 +617,36 @@ class SuperbidScraper:
                 'external_id': f"superbid_{offer_id}",
                 'product_type_desc': product_type,  # categoria original do Superbid
                 'categoria': self._categorize_item(product_type),  # categoria refinada (10 categorias)
-                'scraped_at': datetime.now().isoformat(),
+                'scraped_at': scraped_at or datetime.now().isoformat(),
                 'raw_data': offer,  # TODOS os dados da API
                 'offer_id': offer_id,
                 'has_bids': offer.get('hasBids', False),
-                'link': f"https://exchange.superbid.net/oferta/{offer_id}",
+                'link': f"{self.offer_url}{offer_id}",
             }
             
-        except Exception as e:
-            self.stats['errors'] += 1
+        except (AttributeError, TypeError, ValueError):
+            with self._lock:
+                self.stats['errors'] += 1
             return None
     
-    def save(self, items: List[Dict], output_dir: Path = None) -> Path:
-        """Salva dados coletados (backup local)"""
+    def backup_path(self, output_dir: Path = None) -> Path:
+        """Caminho do backup local (data/superbid_<timestamp>.jsonl.gz)"""
         if output_dir is None:
             output_dir = Path(__file__).parent / 'data'
         
         output_dir.mkdir(parents=True, exist_ok=True)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        json_file = output_dir / f'superbid_{timestamp}.json'
-        
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(items, f, ensure_ascii=False, indent=2)
+        return output_dir / f'superbid_{timestamp}.jsonl.gz'
+    
+    def save(self, items: List[Dict], output_dir: Path = None) -> Path:
+        """Salva dados coletados (backup local)"""
+        writer = NdjsonWriter(self.backup_path(output_dir))
+        try:
+            writer.write(items)
+        finally:
+            writer.close()
         
-        return json_file
+        return writer.path
     
     def print_stats(self):
         """Imprime estatísticas finais"""
@@ -340,8 +671,28 @@ class SuperbidScraper:
         print("\n" + "="*80)
 
 
+def _setup_logging():
+    """
+    Logs das threads vão para uma fila; um listener em background escreve no stdout
+    (threads de scraping não disputam o lock do stdout). Nível via SUPERBID_LOG_LEVEL.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)  # esvazia a fila antes de sair
+    
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(os.getenv('SUPERBID_LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
+
+
 def main():
     """Execução principal - Scrape + Upload"""
+    _setup_logging()
+    
     print("\n" + "="*80)
     print("🚀 SUPERBID - SCRAPER + UPLOAD (COM CATEGORIAS NORMALIZADAS)")
     print("="*80)
@@ -370,59 +721,83 @@ def main():
     # ========================================
     scraper = SuperbidScraper()
     
+    # Backup local gravado durante o scraping (categoria a categoria)
+    writer = NdjsonWriter(scraper.backup_path())
+    json_file = writer.path
+    
+    # Upload para o Supabase também categoria a categoria (só categorias concluídas e ainda
+    # não processadas ficam em memória)
+    upload_stats = {'inserted': 0, 'updated': 0, 'errors': 0}
+    upload_error = None
+    can_upload = bool(os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+    
+    def upload(category_items: List[Dict]):
+        nonlocal supabase, upload_error
+        if not can_upload or upload_error:
+            return
+        
+        try:
+            if not supabase:
+                supabase = SupabaseSuperbid(service_name='superbid_scraper')
+            
+            # Upload em blocos: só um bloco de itens preparados (~100 campos) em memória por vez
+            for i in range(0, len(category_items), UPLOAD_CHUNK_SIZE):
+                chunk_stats = supabase.upsert(category_items[i:i + UPLOAD_CHUNK_SIZE])
+                for key in upload_stats:
+                    upload_stats[key] += chunk_stats[key]
+        except Exception as e:
+            # Falha no upload não interrompe o scraping (backup local continua)
+            upload_error = e
+            print(f"\n❌ Erro no upload Supabase: {str(e)}")
+    
     try:
-        items = scraper.scrape()
+        scraper.scrape(writer, upload)
     except Exception as e:
         # ✅ HEARTBEAT: Registra erro fatal
         if supabase:
             supabase.heartbeat_error(e, context="scrape_main")
         raise
+    finally:
+        writer.close()
     
-    if not items:
+    total_items = scraper.stats['total_scraped']
+    if not total_items:
+        json_file.unlink()
         print("\n⚠️  Nenhum item coletado")
         return 1
     
-    # Salva backup local
-    json_file = scraper.save(items)
     print(f"\n💾 Backup local: {json_file}")
     
     scraper.print_stats()
     
     # ========================================
-    # ETAPA 2: UPLOAD SUPABASE
+    # ETAPA 2: RESULTADO DO UPLOAD SUPABASE
     # ========================================
     print("\n" + "="*80)
     print("🔵 UPLOAD PARA SUPABASE")
     print("="*80)
     
-    try:
-        if not supabase:
-            if not os.getenv('SUPABASE_URL') or not os.getenv('SUPABASE_SERVICE_ROLE_KEY'):
-                print("\n⚠️ Variáveis SUPABASE não configuradas - pulando upload")
-                return 1
-            else:
-                supabase = SupabaseSuperbid(service_name='superbid_scraper')
-        
-        stats = supabase.upsert(items)
-        
-        print("\n" + "="*80)
-        print("📊 RESULTADO DO UPLOAD")
-        print("="*80)
-        print(f"   ✅ Inseridos: {stats['inserted']}")
-        print(f"   🔄 Atualizados: {stats['updated']}")
-        print(f"   ❌ Erros: {stats['errors']}")
-        print("="*80)
-        
-    except Exception as e:
-        print(f"\n❌ Erro no upload Supabase: {str(e)}")
+    if not can_upload:
+        print("\n⚠️ Variáveis SUPABASE não configuradas - pulando upload")
+        return 1
+    
+    if upload_error:
         print("⚠️  Dados foram salvos localmente em:", json_file)
         
         # ✅ HEARTBEAT: Registra erro no insert
         if supabase:
-            supabase.heartbeat_error(e, context="supabase_insert")
+            supabase.heartbeat_error(upload_error, context="supabase_insert")
         
         return 1
     
+    print("\n" + "="*80)
+    print("📊 RESULTADO DO UPLOAD")
+    print("="*80)
+    print(f"   ✅ Inseridos: {upload_stats['inserted']}")
+    print(f"   🔄 Atualizados: {upload_stats['updated']}")
+    print(f"   ❌ Erros: {upload_stats['errors']}")
+    print("="*80)
+    
     # ========================================
     # RESUMO FINAL
     # ========================================
@@ -436,7 +811,7 @@ def main():
     # ✅ HEARTBEAT: Registra sucesso com estatísticas finais
     if supabase:
         supabase.heartbeat_success(final_stats={
-            'total_items': len(items),
+            'total_items': total_items,
             'categories_scraped': len(scraper.categories),
             'with_bids': scraper.stats['with_bids'],
             'by_category': scraper.stats['by_category'],